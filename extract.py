@@ -0,0 +1,100 @@
+"""Resume file -> text extraction
+
+Kept free of import-time side effects (no OpenAI client, database or
+templates) so PARSE_PROCESSES workers can import it cheaply.
+"""
+import io
+import threading
+import zipfile
+
+import PyPDF2
+import pypdfium2 as pdfium
+from docx import Document
+from docx.opc.exceptions import PackageNotFoundError
+from lxml.etree import XMLSyntaxError
+
+# The prompt only ever sees the top of the CV (MAX_RESUME_TOKENS), so
+# extraction stops once this much raw text is in hand, whatever the format
+MAX_EXTRACT_CHARS = 8000
+
+_pdfium_lock = threading.Lock()
+
+def _join_pages(pages) -> str:
+    """Join page (or paragraph) texts from a lazy iterable, stopping at MAX_EXTRACT_CHARS"""
+    parts, size = [], 0
+    for text in pages:
+        parts.append(text)
+        size += len(text)
+        if size >= MAX_EXTRACT_CHARS:
+            break
+    return "\n".join(parts)
+
+
+def _pypdf2_text(fileobj) -> str:
+    """Pure-Python fallback, reading pages in order until the cap"""
+    # One sequential pass: PyPDF2 holds the GIL, so threads wouldn't help.
+    # Pages are extracted lazily, so nothing past MAX_EXTRACT_CHARS is parsed.
+    fileobj.seek(0)
+    pdf = PyPDF2.PdfReader(fileobj)
+    return _join_pages((page.extract_text() or "") for page in pdf.pages)
+
+
+def extract_pdf_text(fileobj) -> str:
+    """Extract PDF text with PDFium, falling back to PyPDF2"""
+    try:
+        fileobj.seek(0)
+        # PDFium is not thread-safe, only one document at a time
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(fileobj)
+            try:
+                text = _join_pages(page.get_textpage().get_text_range() for page in pdf)
+            finally:
+                pdf.close()
+        return text.replace("\r\n", "\n")
+    except pdfium.PdfiumError as e:
+        print(f"PDFium extraction error: {e}")
+
+    return _pypdf2_text(fileobj)
+
+
+def extract_text(filename: str, fileobj) -> str:
+    """Extract text from PDF, DOCX, or TXT files
+
+    A PDF or DOCX that can't be parsed, or holds no text (e.g. a scan),
+    gives "" rather than its raw bytes decoded as text.
+    """
+    ext = filename.lower()
+
+    # ---- PDF ----
+    if ext.endswith(".pdf"):
+        try:
+            return extract_pdf_text(fileobj)
+        except Exception as e:
+            # PyPDF2 has no single error type for malformed files
+            print(f"PDF extraction error: {e}")
+            return ""
+
+    # ---- DOCX ----
+    if ext.endswith(".docx"):
+        try:
+            fileobj.seek(0)
+            doc = Document(fileobj)
+            return _join_pages(p.text for p in doc.paragraphs)
+        except (zipfile.BadZipFile, PackageNotFoundError, KeyError, ValueError,
+                XMLSyntaxError) as e:
+            # Not a zip, a zip without a Word document inside, or corrupt XML
+            print(f"DOCX extraction error: {e}")
+            return ""
+
+    # ---- TXT ----
+    # At most 4 UTF-8 bytes per character; a character cut off at the end
+    # is dropped by errors="ignore"
+    fileobj.seek(0)
+    text = fileobj.read(MAX_EXTRACT_CHARS * 4).decode("utf-8", errors="ignore")
+    return text[:MAX_EXTRACT_CHARS]
+
+
+def parse_bytes(filename: str, data: bytes) -> str:
+    """Extract text from an upload's bytes (picklable, so it runs in any process)"""
+    # BytesIO shares the buffer rather than copying it
+    return extract_text(filename, io.BytesIO(data))
@@ -1,36 +1,79 @@
 import os
-import io
-import json
+import asyncio
+import re
+import hashlib
+import multiprocessing
 import sqlite3
-import tempfile
-from datetime import datetime
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+from contextlib import asynccontextmanager, contextmanager
+from concurrent.futures import ProcessPoolExecutor
 
-from fastapi import FastAPI, Request, UploadFile, Form
+from fastapi import FastAPI, Request, UploadFile, Form, Query
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
-from openai import OpenAI
-import PyPDF2
-from docx import Document
+from openai import AsyncOpenAI
+import httpx
+import numpy as np
+import orjson
+import tiktoken
 from dotenv import load_dotenv
 
+from extract import parse_bytes
+
 # Load environment variables
 load_dotenv()
 
 # -------------------------------------------------------
 # FASTAPI APP
 # -------------------------------------------------------
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    """Per-worker setup: schema check, semantic cache and the DB writer"""
+    await asyncio.to_thread(init_db)
+    if SEMANTIC_CACHE:
+        await load_semantic_cache()
+    parse_pool = start_parse_pool()
+    writer = start_writer()
+    poller = asyncio.create_task(poll_batches())
+    yield
+    poller.cancel()
+    writer.cancel()
+    if parse_pool is not None:
+        # Don't block the event loop waiting on in-flight parses
+        parse_pool.shutdown(wait=False, cancel_futures=True)
+    # Close pooled OpenAI connections instead of leaving them to the GC
+    await http_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
+# Leaderboard and result pages are repetitive HTML and shrink several-fold
+app.add_middleware(GZipMiddleware, minimum_size=512)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
+# Templates only change on deploy: compile them all now and skip the
+# per-render mtime check
+templates.env.auto_reload = False
+for _name in ("index.html", "result.html", "duplicate.html", "leaderboard.html"):
+    templates.get_template(_name)
 
 # Initialize OpenAI client with API key from environment
 api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     raise RuntimeError("❌ OPENAI_API_KEY missing! Add it to your .env file.")
 
-client = OpenAI(api_key=api_key)
+# One pooled HTTP/2 client for the whole process: concurrent roasts are
+# multiplexed over warm connections instead of paying a TLS handshake each
+http_client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+    timeout=60.0
+)
+client = AsyncOpenAI(api_key=api_key, http_client=http_client)
 print("✅ OpenAI client initialized successfully")
 
 # -------------------------------------------------------
@@ -38,142 +81,539 @@ print("✅ OpenAI client initialized successfully")
 # -------------------------------------------------------
 DB_PATH = "roasts.db"
 
-def init_db():
-    """Initialize database with schema"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS roasts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        score INTEGER,
-        one_line TEXT,
-        overview TEXT,
-        fun_obs TEXT,
-        created_at TEXT
-    )
-    """)
-    conn.commit()
-    conn.close()
+# Hot-path SQL kept as module constants so sqlite3's statement cache
+# reuses the compiled statement on every request
+SQL_CHECK_NAME = """
+    SELECT 1 FROM roasts WHERE name = ?
+    UNION ALL
+    SELECT 1 FROM pending_roasts WHERE name = ? AND error IS NULL
+    LIMIT 1
+"""
+
+SQL_GET_BY_HASH = """
+    SELECT name, score, one_line, overview, fun_obs
+    FROM roasts
+    WHERE file_hash = ?
+    LIMIT 1
+"""
+
+SQL_INSERT_ROAST = """
+    INSERT INTO roasts (name, score, one_line, overview, fun_obs, file_hash, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, strftime('%Y-%m-%d %H:%M:%S', 'now'))
+"""
+
+SQL_CACHE_GET = "SELECT response FROM roast_cache WHERE key = ?"
+
+SQL_CACHE_PUT = """
+    INSERT OR IGNORE INTO roast_cache (key, mode, embedding, response, created_at)
+    VALUES (?, ?, ?, ?, strftime('%Y-%m-%d %H:%M:%S', 'now'))
+"""
+
+SQL_CACHE_ALL = "SELECT mode, embedding, response FROM roast_cache"
+
+# A file whose earlier batch failed can be queued again; one still waiting
+# keeps its row (and its batch)
+SQL_PENDING_ADD = """
+    INSERT INTO pending_roasts (file_hash, batch_id, name, mode, error, created_at)
+    VALUES (?, ?, ?, ?, NULL, strftime('%Y-%m-%d %H:%M:%S', 'now'))
+    ON CONFLICT(file_hash) DO UPDATE SET
+        batch_id = excluded.batch_id,
+        name = excluded.name,
+        mode = excluded.mode,
+        error = NULL,
+        created_at = excluded.created_at
+    WHERE pending_roasts.error IS NOT NULL
+"""
+
+SQL_PENDING_BY_HASH = "SELECT 1 FROM pending_roasts WHERE file_hash = ? AND error IS NULL"
+
+SQL_PENDING_BATCHES = "SELECT DISTINCT batch_id FROM pending_roasts WHERE error IS NULL"
+
+SQL_PENDING_FOR_BATCH = """
+    SELECT file_hash, name, mode FROM pending_roasts
+    WHERE batch_id = ? AND error IS NULL
+"""
+
+SQL_PENDING_DONE = "DELETE FROM pending_roasts WHERE file_hash = ?"
+
+SQL_PENDING_FAILED = "UPDATE pending_roasts SET error = ? WHERE file_hash = ?"
+
+SQL_LEADERBOARD = """
+    SELECT name, score, one_line, created_at
+    FROM roasts
+    ORDER BY score DESC, created_at DESC
+    LIMIT ? OFFSET ?
+"""
+
+# Connections are per thread, opened lazily and reused for the life of the
+# thread: a read-only one for lookups and a read-write one for writes. WAL
+# lets readers run alongside the writer, and _write_lock keeps this
+# process's writer threads from queueing on SQLite's own lock.
+_tls = threading.local()
+_write_lock = threading.Lock()
 
-# Initialize DB on startup
-init_db()
+def _apply_pragmas(conn):
+    """Per-connection tuning"""
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA cache_size=-20000")  # ~20 MB page cache
+    conn.execute("PRAGMA busy_timeout=5000")  # wait for the writer instead of SQLITE_BUSY
 
-def get_db():
-    """Get database connection (thread-safe)"""
-    conn = sqlite3.connect(DB_PATH)
+def get_conn():
+    """Get this thread's database connection"""
+    conn = getattr(_tls, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH)
+        _apply_pragmas(conn)
+        _tls.conn = conn
     return conn
 
+def get_read_conn():
+    """Get this thread's read-only database connection"""
+    conn = getattr(_tls, "reader", None)
+    if conn is None:
+        conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+        _apply_pragmas(conn)
+        # Belt and braces: refuse writes even if one slips onto this connection
+        conn.execute("PRAGMA query_only=1")
+        _tls.reader = conn
+    return conn
+
+@contextmanager
+def write_txn():
+    """This thread's writer connection inside a transaction, one writer at a time"""
+    conn = get_conn()
+    with _write_lock, conn:
+        # Take SQLite's write lock up front rather than on the first write,
+        # so another process's writer can't make this one fail midway
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
+
+SCHEMA_VERSION = 1
+
+def migrate_db(conn):
+    """Bring an existing database up to SCHEMA_VERSION, tracked in user_version"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < 1:
+        # Older databases predate the file_hash column
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(roasts)")}
+        if "file_hash" not in columns:
+            conn.execute("ALTER TABLE roasts ADD COLUMN file_hash TEXT")
+        # Superseded by the covering leaderboard index
+        conn.execute("DROP INDEX IF EXISTS idx_roasts_score")
+    if version < SCHEMA_VERSION:
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+def init_db():
+    """Initialize database with schema"""
+    conn = get_conn()
+    # Persistent, so setting it once here covers every later connection
+    conn.execute("PRAGMA journal_mode=WAL")
+    with conn:
+        # Workers start together; hold the write lock so only one migrates
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS roasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            score INTEGER,
+            one_line TEXT,
+            overview TEXT,
+            fun_obs TEXT,
+            file_hash TEXT,
+            created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now'))
+        )
+        """)
+        migrate_db(conn)
+        # Duplicate checks probe by file hash and by name
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_roasts_file_hash ON roasts(file_hash)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_roasts_name ON roasts(name)")
+        # Covers the leaderboard query: its ORDER BY and every selected column
+        # come straight from the index, no sort and no table lookups
+        conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_roasts_leaderboard
+        ON roasts(score DESC, created_at DESC, name, one_line)
+        """)
+        # Resumes sent through /upload_batch, waiting on OpenAI's Batch API
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS pending_roasts (
+            file_hash TEXT PRIMARY KEY,
+            batch_id TEXT,
+            name TEXT,
+            mode TEXT,
+            -- Set when the batch ended without a roast for this file
+            error TEXT,
+            created_at TEXT
+        )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_batch ON pending_roasts(batch_id)")
+        # Semantic cache (only used when SEMANTIC_CACHE is set)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS roast_cache (
+            key TEXT PRIMARY KEY,
+            mode TEXT,
+            embedding BLOB,
+            response TEXT,
+            created_at TEXT
+        )
+        """)
+
+    # Keep existing data across restarts; just refresh planner statistics
+    conn.execute("PRAGMA optimize")
+    if os.getenv("VACUUM_ON_STARTUP"):
+        conn.execute("VACUUM")
+
 # -------------------------------------------------------
 # FILE → TEXT
 # -------------------------------------------------------
-def extract_text(file: UploadFile) -> str:
-    """Extract text from PDF, DOCX, or TXT files"""
-    ext = file.filename.lower()
-    raw = file.file.read()
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # 10 MB is plenty for any CV
+# Whole multipart request: the file plus form fields and boundaries
+MAX_REQUEST_BYTES = MAX_UPLOAD_BYTES + 64 * 1024
+# /upload_batch takes many CVs at once, but still within reason
+MAX_BATCH_REQUEST_BYTES = 50 * 1024 * 1024
 
-    # ---- PDF ----
-    if ext.endswith(".pdf"):
-        try:
-            pdf = PyPDF2.PdfReader(io.BytesIO(raw))
-            text = "\n".join((p.extract_text() or "") for p in pdf.pages)
-            if text.strip():
-                return text
-        except Exception as e:
-            print(f"PDF extraction error: {e}")
+_WS = re.compile(r"[ \t]+")
+_NL = re.compile(r"\n{3,}")
 
-    # ---- DOCX ----
-    if ext.endswith(".docx"):
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp:
-                tmp.write(raw)
-                tmp_path = tmp.name
-
-            doc = Document(tmp_path)
-            os.remove(tmp_path)
-            text = "\n".join(p.text for p in doc.paragraphs)
-            if text.strip():
-                return text
-        except Exception as e:
-            print(f"DOCX extraction error: {e}")
+def hash_upload(fileobj) -> tuple:
+    """Read an upload once; return its bytes and SHA-256"""
+    # A single read (bounded by MAX_UPLOAD_BYTES) feeds both the hash and
+    # the parser
+    data = fileobj.read()
+    return data, hashlib.sha256(data).hexdigest()
 
-    # ---- TXT ----
-    try:
-        text = raw.decode("utf-8", errors="ignore")
-        if text.strip():
-            return text
-    except Exception as e:
-        print(f"TXT extraction error: {e}")
 
-    return ""
+def read_upload(filename: str, fileobj) -> tuple:
+    """Read an upload once; return its extracted text and SHA-256"""
+    data, file_hash = hash_upload(fileobj)
+    return parse_bytes(filename, data), file_hash
+
+
+# Optional: parse in a pool of worker processes instead of a thread.
+# Parsing is CPU-bound Python (PyPDF2, python-docx) that holds the GIL, and
+# PDFium takes one document per process at a time. Off by default; set
+# PARSE_PROCESSES to the pool size to enable. Workers run extract.parse_bytes
+# and so import extract.py, not this module (spawn does also re-run the
+# launching script, which is gunicorn's in the Docker image).
+PARSE_PROCESSES = int(os.getenv("PARSE_PROCESSES", "0"))
+
+_parse_pool = None
+
+def start_parse_pool():
+    """Create the parser process pool if PARSE_PROCESSES is set"""
+    global _parse_pool
+    if PARSE_PROCESSES > 0:
+        # spawn, not fork: the serving process has threads and open sockets
+        _parse_pool = ProcessPoolExecutor(
+            PARSE_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _parse_pool
+
+
+async def load_upload(filename: str, fileobj) -> tuple:
+    """Extracted text and SHA-256 of an upload, worked out off the event loop"""
+    if _parse_pool is None:
+        return await asyncio.to_thread(read_upload, filename, fileobj)
+    data, file_hash = await asyncio.to_thread(hash_upload, fileobj)
+    loop = asyncio.get_running_loop()
+    text = await loop.run_in_executor(_parse_pool, parse_bytes, filename, data)
+    return text, file_hash
+
+
+def normalize_text(text: str) -> str:
+    """Collapse runs of spaces/tabs and blank lines left over from extraction"""
+    return _NL.sub("\n\n", _WS.sub(" ", text)).strip()
+
+
+def truncate_text(text: str, limit: int) -> str:
+    """Cut text to at most limit UTF-8 bytes without splitting a character"""
+    return text.encode("utf-8")[:limit].decode("utf-8", "ignore")
 
 
 # -------------------------------------------------------
 # NAME GUESS
 # -------------------------------------------------------
+# Letters (any script), whitespace and the punctuation names use
+_NAME_CHARS = re.compile(r"(?:[^\W\d_]|[\s'.-])+")
+_LINES = re.compile(r"^[^\S\n]*(\S.*?)[^\S\n]*$", re.M)
+_HEADER_WORDS = re.compile(r"\b(?:resume|cv|curriculum|vitae|contact|email|phone)\b", re.I)
+
 def guess_name(text):
     """Try to extract candidate name from first few lines"""
-    lines = text.split("\n")[:10]
-    for line in lines:
-        line = line.strip()
-        # Look for name patterns
+    # Non-blank lines, stripped, found lazily so only the top of the text is scanned
+    for match in islice(_LINES.finditer(text), 10):
+        line = match.group(1)
+        # Look for name patterns, skipping common header words
         if 2 <= len(line.split()) <= 4:
-            if all(c.isalpha() or c.isspace() or c in "'-." for c in line):
-                # Skip common header words
-                if not any(word.lower() in line.lower() for word in 
-                          ["resume", "cv", "curriculum", "vitae", "contact", "email", "phone"]):
-                    return line
+            if _NAME_CHARS.fullmatch(line) and not _HEADER_WORDS.search(line):
+                return line
     return "Anonymous"
 
 
-def check_duplicate(name, text_sample):
-    """Check if this resume was already submitted"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Check by name first
-    cursor.execute("SELECT COUNT(*) FROM roasts WHERE name = ?", (name,))
-    count = cursor.fetchone()[0]
-    conn.close()
-    
-    return count > 0
+# -------------------------------------------------------
+# ROAST CACHE
+# -------------------------------------------------------
+# Recently stored roasts keyed by file hash, so repeat uploads of the same
+# file are answered without touching SQLite
+ROAST_CACHE_MAX = 1024
+_roast_cache = OrderedDict()
+_roast_cache_lock = threading.Lock()  # touched from DB worker threads
+
+def cache_get(file_hash):
+    """Look up a cached roast and mark it as recently used"""
+    with _roast_cache_lock:
+        roast = _roast_cache.get(file_hash)
+        if roast is not None:
+            _roast_cache.move_to_end(file_hash)
+        return roast
+
+def cache_put(file_hash, roast):
+    """Cache a roast, evicting the least recently used entry when full"""
+    with _roast_cache_lock:
+        _roast_cache[file_hash] = roast
+        _roast_cache.move_to_end(file_hash)
+        if len(_roast_cache) > ROAST_CACHE_MAX:
+            _roast_cache.popitem(last=False)
+
+
+def find_previous(name, file_hash):
+    """Look up earlier submissions of this resume
+
+    Returns (roast, taken): the stored roast if this exact file was roasted
+    before, otherwise why it can't be roasted now: "pending" if the file
+    is waiting in a batch, "name" if another file already used this name,
+    or None.
+    """
+    roast = cache_get(file_hash)
+    if roast is not None:
+        return roast, None
+
+    conn = get_read_conn()
+    row = conn.execute(SQL_GET_BY_HASH, (file_hash,)).fetchone()
+    if row is not None:
+        roast = dict(zip(("name", "score", "one_line", "overview", "fun_obs"), row))
+        cache_put(file_hash, roast)
+        return roast, None
+
+    if conn.execute(SQL_PENDING_BY_HASH, (file_hash,)).fetchone() is not None:
+        return None, "pending"
+
+    # Every unnamed resume is "Anonymous", so the name says nothing there
+    if name == "Anonymous":
+        return None, None
+    if conn.execute(SQL_CHECK_NAME, (name, name)).fetchone() is not None:
+        return None, "name"
+    return None, None
+
+
+# When this process last committed new roasts; cached leaderboard pages
+# rendered before then are stale
+_roasts_changed_at = 0.0
+
+def mark_roasts_changed():
+    """Record that new roasts were just committed"""
+    global _roasts_changed_at
+    _roasts_changed_at = time.monotonic()
+
+
+def save_roasts(entries):
+    """Store finished roasts in one transaction (commits when the block exits)"""
+    with write_txn() as conn:
+        insert_roasts(conn, entries)
+    mark_roasts_changed()
+    for name, roast, file_hash in entries:
+        cache_put(file_hash, dict(roast, name=name))
+
+
+def insert_roasts(conn, entries):
+    """Insert (name, roast, file_hash) entries in the caller's transaction"""
+    conn.executemany(SQL_INSERT_ROAST, [(
+            name,
+            roast["score"],
+            roast["one_line"],
+            roast["overview"],
+            roast["fun_obs"],
+            file_hash
+        ) for name, roast, file_hash in entries])
+
+
+# Roasts that finish together (e.g. one batch) are written by a single
+# background writer in one transaction, so they share one WAL sync
+WRITE_BATCH_MAX = 64
+
+_write_queue = None
+
+async def store_roast(name, roast, file_hash):
+    """Queue a roast for the writer and wait until it is committed"""
+    future = asyncio.get_running_loop().create_future()
+    await _write_queue.put((name, roast, file_hash, future))
+    await future
+
+
+def start_writer():
+    """Start the background DB writer on the running event loop"""
+    global _write_queue
+    _write_queue = asyncio.Queue()
+    return asyncio.create_task(_write_worker(_write_queue))
+
+
+async def _write_worker(queue):
+    """Drain whatever roasts are queued and insert them together"""
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < WRITE_BATCH_MAX and not queue.empty():
+            batch.append(queue.get_nowait())
+        try:
+            await asyncio.to_thread(save_roasts, [entry[:3] for entry in batch])
+            error = None
+        except Exception as e:
+            print(f"DB write error: {e}")
+            error = e
+        for *_, future in batch:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
 
 
 # -------------------------------------------------------
 # SAFE JSON
 # -------------------------------------------------------
+def json_block(raw):
+    """Return the first balanced {...} block in raw, or None (single linear pass)"""
+    start = raw.find("{")
+    if start < 0:
+        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(raw)):
+        c = raw[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return raw[start:i + 1]
+    return None
+
+
+JSON_FALLBACK = {
+    "one_line": "Your CV confused the AI.",
+    "overview": "Model failed JSON parsing.",
+    "fun_obs": "",
+    "score": 1
+}
+
 def safe_json(raw):
     """Safely parse JSON with fallback"""
     try:
-        return json.loads(raw)
+        return orjson.loads(raw)
     except Exception as e:
+        # The model occasionally wraps the object in prose or code fences
+        block = json_block(raw or "")
+        if block:
+            try:
+                return orjson.loads(block)
+            except Exception:
+                pass
         print(f"JSON parse error: {e}")
         print(f"Raw response: {raw}")
-        return {
-            "one_line": "Your CV confused the AI.",
-            "overview": "Model failed JSON parsing.",
-            "fun_obs": "",
-            "score": 1
-        }
+        # Copy, since callers may modify what they get back
+        return dict(JSON_FALLBACK)
 
 
 # -------------------------------------------------------
 # ROAST ENGINE
 # -------------------------------------------------------
-def roast_resume(text, mode):
-    """Generate brutal resume roast using OpenAI"""
-    if not text.strip():
-        return {
-            "one_line": "Your file contains no readable text.",
-            "overview": "Extraction failed — try uploading a cleaner PDF/DOCX.",
-            "fun_obs": "",
-            "score": 1
-        }
+# Resume text budget, counted in model tokens since that's what the prompt
+# is billed and limited by
+MAX_RESUME_TOKENS = 1000
+# Quick roasts only need the top of the CV
+QUICK_RESUME_TOKENS = 500
+# Used when the tokenizer can't be loaded: ~4 bytes per token
+BYTES_PER_TOKEN = 4
+
+# Quick mode can be pointed at a lighter/faster model than full roasts
+ROAST_MODEL = os.getenv("ROAST_MODEL", "gpt-4o-mini")
+QUICK_MODEL = os.getenv("QUICK_MODEL", ROAST_MODEL)
+# Modes the upload forms offer
+ROAST_MODES = ("quick", "full")
+
+def _load_encoding():
+    """Tokenizer for ROAST_MODEL, or None if it can't be loaded"""
+    try:
+        try:
+            return tiktoken.encoding_for_model(ROAST_MODEL)
+        except KeyError:
+            # Model name tiktoken doesn't know yet; current models share this
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # First load downloads the vocabulary, which fails offline
+        print(f"Tokenizer unavailable, truncating by bytes: {e}")
+        return None
+
+_encoding = _load_encoding()
 
-    # Limit text to avoid token limits
-    text_sample = text[:4000]
+def truncate_tokens(text: str, limit: int) -> str:
+    """Cut text to at most limit model tokens"""
+    # Byte cut first so a huge upload is never tokenized in full
+    text = truncate_text(text, limit * BYTES_PER_TOKEN * 2)
+    if _encoding is None:
+        return truncate_text(text, limit * BYTES_PER_TOKEN)
+    tokens = _encoding.encode(text, disallowed_special=())
+    if len(tokens) <= limit:
+        return text
+    # Decode bytes so a character split across tokens is dropped, not mangled
+    return _encoding.decode_bytes(tokens[:limit]).decode("utf-8", "ignore")
 
-    prompt = f"""You are RoastRank — the Gordon Ramsay of resume criticism. Your job is to deliver CREATIVE, SPECIFIC, and SAVAGE roasts.
+
+# Cap on in-flight OpenAI calls; past this, requests queue here instead of
+# piling into 429s and the SDK's retry backoff
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "16"))
+_openai_slots = asyncio.Semaphore(OPENAI_CONCURRENCY)
+
+async def chat_completion(**kwargs):
+    """Call the chat completions API, waiting for a free slot first"""
+    async with _openai_slots:
+        return await client.chat.completions.create(**kwargs)
+
+# The fixed instructions live in the system message and the resume alone
+# in the user message, so every call starts with the same prefix. These
+# prompts are well under the 1024 tokens OpenAI's prompt caching needs, so
+# it doesn't apply to them today.
+QUICK_SYSTEM_PROMPT = """You are RoastRank — the Gordon Ramsay of resume criticism.
+
+Give the resume you are sent a FAST, SAVAGE, HYPER-SPECIFIC roast. Reference
+something that is actually in it. No generic phrases like "buzzwords" or
+"lacks clarity".
+
+Reply with EXACTLY these four lines and nothing else:
+NAME: <the candidate's full name, or Anonymous>
+SCORE: <1-100, harsh but fair>
+ROAST: <one creative, quotable one-liner about THEIR resume>
+PUNCHLINE: <a clever comparison or metaphor>"""
+
+QUICK_USER_TEMPLATE = """Resume text:
+{text}"""
+
+# Shared by single and batched full roasts
+ROAST_RULES = """You are RoastRank, the most savage and creative resume critic alive. Every roast must be unique, specific, and memorable. NO generic criticisms allowed.
+
+You are the Gordon Ramsay of resume criticism. Your job is to deliver CREATIVE, SPECIFIC, and SAVAGE roasts.
 
 CRITICAL RULES:
 1. NO GENERIC PHRASES like "bloated", "jargon", "buzzwords", "jumbled mess", "lacks clarity"
@@ -182,44 +622,192 @@ CRITICAL RULES:
 4. VARY YOUR HUMOR - use sarcasm, absurdism, technical jokes, industry-specific burns
 5. MAKE IT MEMORABLE - each roast should be unique and quotable
 
-Analyze this resume and find THE MOST INTERESTING FLAW:
+Analyze the resume and find THE MOST INTERESTING FLAW:
 - Did they list "proficient in Microsoft Word" in 2024?
 - Do they have 47 buzzwords but zero measurable achievements?
 - Is their job title longer than their actual responsibilities?
 - Did they "lead" 10 projects as a junior developer?
 - Are they a "rockstar ninja guru" instead of having actual skills?
+"""
 
-Resume Mode: {mode}
-
-Resume text:
-{text_sample}
-
-Return ONLY valid JSON:
-{{
+ROAST_FIELDS = """{
+  "name": "The candidate's full name as written on the resume, or Anonymous",
   "one_line": "A SPECIFIC, CREATIVE one-liner (reference something from THEIR resume)",
   "overview": "2-3 sentences with CONCRETE observations (quote or reference specific things you see)",
   "fun_obs": "A clever punchline with a CREATIVE comparison or metaphor",
   "score": 1-100 (be harsh but fair: 1-30=disaster, 31-50=weak, 51-70=okay, 71-85=solid, 86-100=impressive)
-}}
+}"""
 
-Examples of GOOD roasts:
+ROAST_EXAMPLES = """Examples of GOOD roasts:
 - "You listed Excel as a skill in 2024. What's next, bragging about your fax machine expertise?"
 - "Three internships and zero full-time roles - you're basically a professional coffee fetcher with a LinkedIn."
 - "Your resume claims you 'revolutionized' something at a company that shut down six months later."
+"""
+
+FULL_SYSTEM_PROMPT = ROAST_RULES + """
+Return ONLY valid JSON:
+""" + ROAST_FIELDS + """
+
+""" + ROAST_EXAMPLES + """
+Return ONLY the JSON object, nothing else."""
+
+FULL_USER_TEMPLATE = """Resume Mode: {mode}
+
+Resume text:
+{text}"""
+
+BATCH_SYSTEM_PROMPT = ROAST_RULES + """
+You will be sent several DIFFERENT resumes, each under its own "### Resume N"
+header. Roast each one on its own merits and never mix details between them.
+
+Return ONLY valid JSON of the form {"roasts": [...]}, with exactly one
+object per resume, in the same order, each shaped like:
+""" + ROAST_FIELDS + """
 
+""" + ROAST_EXAMPLES + """
 Return ONLY the JSON object, nothing else."""
 
+BATCH_USER_TEMPLATE = """{count} resumes:
+
+{resumes}"""
+
+# Structured Outputs: the model is constrained to exactly these fields,
+# so replies parse on the first try (safe_json stays as the net for
+# refusals and replies cut off at max_tokens)
+ROAST_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "one_line": {"type": "string"},
+        "overview": {"type": "string"},
+        "fun_obs": {"type": "string"},
+        "score": {"type": "integer"}
+    },
+    "required": ["name", "one_line", "overview", "fun_obs", "score"],
+    "additionalProperties": False
+}
+
+FULL_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "roast", "strict": True, "schema": ROAST_SCHEMA}
+}
+
+BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "roasts",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"roasts": {"type": "array", "items": ROAST_SCHEMA}},
+            "required": ["roasts"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# Quick mode answers in four fixed plain-text lines, so one regex pulls
+# out every field without going through a JSON parser
+_QUICK_RE = re.compile(
+    r"NAME:\s*(.*?)\s*SCORE:\s*(\d+)\s*ROAST:\s*(.*?)\s*PUNCHLINE:\s*(.*)", re.S
+)
+
+def quick_request(text_sample):
+    """Chat completion arguments for a quick roast"""
+    prompt = QUICK_USER_TEMPLATE.format(text=truncate_tokens(text_sample, QUICK_RESUME_TOKENS))
+    return {
+        "model": QUICK_MODEL,
+        "messages": [
+            {"role": "system", "content": QUICK_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 1.0,
+        "max_tokens": 200
+    }
+
+
+def parse_quick(raw):
+    """Turn a four-line quick roast reply into a roast dict"""
+    match = _QUICK_RE.search(raw)
+    if not match:
+        print(f"Quick roast format error: {raw}")
+        return {
+            "one_line": raw.strip() or "Your CV confused the AI.",
+            "overview": "",
+            "fun_obs": "",
+            "score": 1
+        }
+
+    return {
+        "name": match.group(1).strip(),
+        "one_line": match.group(3).strip(),
+        "overview": "",
+        "fun_obs": match.group(4).strip(),
+        "score": max(1, min(100, int(match.group(2))))
+    }
+
+
+async def roast_quick(text_sample):
+    """Generate a short quick-mode roast using OpenAI"""
     try:
-        res = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are RoastRank, the most savage and creative resume critic alive. Every roast must be unique, specific, and memorable. NO generic criticisms allowed."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=1.0,  # Increased for more creativity
-            max_tokens=600,
-            response_format={"type": "json_object"}
-        )
+        res = await chat_completion(**quick_request(text_sample))
+        raw = res.choices[0].message.content or ""
+    except Exception as e:
+        print(f"OpenAI API Error: {e}")
+        return {
+            "one_line": "AI roast engine crashed.",
+            "overview": f"Error calling OpenAI API: {str(e)}",
+            "fun_obs": "Maybe check your API key?",
+            "score": 1
+        }
+
+    return parse_quick(raw)
+
+
+async def roast_resume(text, mode):
+    """Generate brutal resume roast using OpenAI"""
+    if not text.strip():
+        return {
+            "one_line": "Your file contains no readable text.",
+            "overview": "Extraction failed — try uploading a cleaner PDF/DOCX.",
+            "fun_obs": "",
+            "score": 1
+        }
+
+    if SEMANTIC_CACHE:
+        return await roast_cached(text, mode)
+    return await roast_uncached(text, mode)
+
+
+async def roast_uncached(text, mode):
+    """Send a resume to the model, picking the call that fits the mode"""
+    # Quick mode has a fixed four-line shape, no JSON needed
+    if mode == "quick":
+        return await roast_quick(text)
+
+    if ROAST_BATCH_SIZE > 1:
+        return await roast_batched(text)
+    return await roast_full(text, mode)
+
+
+def full_request(text, mode):
+    """Chat completion arguments for a full roast"""
+    return {
+        "model": ROAST_MODEL,
+        "messages": [
+            {"role": "system", "content": FULL_SYSTEM_PROMPT},
+            {"role": "user", "content": FULL_USER_TEMPLATE.format(mode=mode, text=text)}
+        ],
+        "temperature": 1.0,  # Increased for more creativity
+        "max_tokens": 600,
+        "response_format": FULL_RESPONSE_FORMAT
+    }
+
+
+async def roast_full(text, mode):
+    """Generate a single full roast using OpenAI"""
+    try:
+        res = await chat_completion(**full_request(text, mode))
         raw = res.choices[0].message.content
         return safe_json(raw)
     except Exception as e:
@@ -232,83 +820,571 @@ Return ONLY the JSON object, nothing else."""
         }
 
 
+# -------------------------------------------------------
+# ROAST BATCHING
+# -------------------------------------------------------
+# Optional: full roasts that arrive within ROAST_BATCH_WAIT_MS of each
+# other share one OpenAI call (up to ROAST_BATCH_SIZE resumes). Off by
+# default; set ROAST_BATCH_SIZE above 1 to enable.
+ROAST_BATCH_SIZE = int(os.getenv("ROAST_BATCH_SIZE", "1"))
+ROAST_BATCH_WAIT = int(os.getenv("ROAST_BATCH_WAIT_MS", "50")) / 1000
+
+_batch_queue = None
+
+async def roast_batched(text):
+    """Queue a full roast for the batcher and wait for its result"""
+    global _batch_queue
+    if _batch_queue is None:
+        _batch_queue = asyncio.Queue()
+        asyncio.create_task(_batch_worker(_batch_queue))
+
+    future = asyncio.get_running_loop().create_future()
+    await _batch_queue.put((text, future))
+    return await future
+
+
+async def _batch_worker(queue):
+    """Collect queued roasts into batches and dispatch each one"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + ROAST_BATCH_WAIT
+        while len(batch) < ROAST_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Don't hold up collection of the next batch on this one's LLM call
+        asyncio.create_task(_run_batch(batch))
+
+
+async def _run_batch(batch):
+    """Roast a batch in one call and hand each waiter its result"""
+    texts = [text for text, _ in batch]
+    try:
+        roasts = await _roast_many(texts) if len(texts) > 1 else None
+        if roasts is None:
+            # Single resume, or the batch reply was unusable: roast one by one
+            roasts = await asyncio.gather(*(roast_full(t, "full") for t in texts))
+    except Exception as e:
+        print(f"Batch roast error: {e}")
+        roasts = [{
+            "one_line": "AI roast engine crashed.",
+            "overview": f"Error calling OpenAI API: {str(e)}",
+            "fun_obs": "Maybe check your API key?",
+            "score": 1
+        }] * len(texts)
+
+    for (_, future), roast in zip(batch, roasts):
+        # The request may have been cancelled (e.g. found to be a duplicate)
+        if not future.done():
+            future.set_result(roast)
+
+
+async def _roast_many(texts):
+    """One OpenAI call for several resumes; None if the reply doesn't line up"""
+    resumes = "\n\n".join(
+        f"### Resume {i}\n{text}" for i, text in enumerate(texts, 1)
+    )
+    prompt = BATCH_USER_TEMPLATE.format(count=len(texts), resumes=resumes)
+
+    res = await chat_completion(
+        model=ROAST_MODEL,
+        messages=[
+            {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=1.0,
+        max_tokens=600 * len(texts),
+        response_format=BATCH_RESPONSE_FORMAT
+    )
+    roasts = safe_json(res.choices[0].message.content).get("roasts")
+    fields = ("one_line", "overview", "fun_obs", "score")
+    if (not isinstance(roasts, list) or len(roasts) != len(texts)
+            or not all(isinstance(r, dict) and all(f in r for f in fields) for r in roasts)):
+        print(f"Batch roast reply didn't match the {len(texts)} resumes sent")
+        return None
+    return roasts
+
+
+# -------------------------------------------------------
+# BULK ROASTS (OpenAI Batch API)
+# -------------------------------------------------------
+# /upload_batch sends many resumes as one Batch API job: half the price of
+# live calls and a separate rate-limit pool, in exchange for results that
+# arrive within 24h. A background poller stores finished roasts.
+BATCH_MAX_FILES = 100
+BATCH_POLL_SECONDS = int(os.getenv("BATCH_POLL_SECONDS", "60"))
+# Batch API states after which the output (if any) won't change
+BATCH_FINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+def roast_request(text, mode):
+    """Chat completion arguments for a roast in the given mode"""
+    return quick_request(text) if mode == "quick" else full_request(text, mode)
+
+
+def save_pending(batch_id, mode, entries):
+    """Record (file_hash, name) entries as waiting on a batch"""
+    with write_txn() as conn:
+        conn.executemany(SQL_PENDING_ADD, [
+            (file_hash, batch_id, name, mode) for file_hash, name in entries
+        ])
+
+
+def pending_batches():
+    """IDs of batches that still have roasts waiting"""
+    return [row[0] for row in get_read_conn().execute(SQL_PENDING_BATCHES)]
+
+
+def finish_batch(batch_id, replies, errors, status):
+    """Store a finished batch's roasts and clear their pending rows
+
+    Rows without a reply stay in pending_roasts with their error, so they
+    are no longer polled and the file can be sent again.
+    """
+    with write_txn() as conn:
+        # Every worker polls; SQLite's write lock makes sure only one stores
+        entries, done, failed = [], [], []
+        for file_hash, name, mode in conn.execute(SQL_PENDING_FOR_BATCH, (batch_id,)).fetchall():
+            raw = replies.get(file_hash)
+            if raw is None:
+                failed.append((errors.get(file_hash) or f"batch {status}", file_hash))
+                continue
+            done.append((file_hash,))
+            # Roasted through /upload while it waited (e.g. queued before
+            # the pending check existed): keep the first roast
+            if conn.execute(SQL_GET_BY_HASH, (file_hash,)).fetchone() is not None:
+                continue
+            roast = parse_quick(raw) if mode == "quick" else safe_json(raw)
+            entries.append((pick_name(name, roast), roast, file_hash))
+        insert_roasts(conn, entries)
+        conn.executemany(SQL_PENDING_DONE, done)
+        conn.executemany(SQL_PENDING_FAILED, failed)
+    for error, file_hash in failed:
+        print(f"Batch {batch_id}: no roast for {file_hash[:12]} ({error})")
+    if entries:
+        mark_roasts_changed()
+    for name, roast, file_hash in entries:
+        cache_put(file_hash, dict(roast, name=name))
+
+
+async def submit_batch(requests, mode):
+    """Upload {file_hash: (name, text)} as one Batch API job; return its id"""
+    lines = b"".join(orjson.dumps({
+        "custom_id": file_hash,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": roast_request(text, mode)
+    }, option=orjson.OPT_APPEND_NEWLINE) for file_hash, (_, text) in requests.items())
+
+    batch_file = await client.files.create(file=("roasts.jsonl", lines), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    entries = [(file_hash, name) for file_hash, (name, _) in requests.items()]
+    await asyncio.to_thread(save_pending, batch.id, mode, entries)
+    return batch.id
+
+
+async def check_batch(batch_id):
+    """Store a batch's roasts once OpenAI has finished it"""
+    batch = await client.batches.retrieve(batch_id)
+    if batch.status not in BATCH_FINAL_STATES:
+        return
+
+    # Requests that failed go to a separate error file, not the output file
+    replies, errors = {}, {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        output = await client.files.content(file_id)
+        for line in output.text.splitlines():
+            item = orjson.loads(line)
+            body = (item.get("response") or {}).get("body") or {}
+            if body.get("choices"):
+                replies[item["custom_id"]] = body["choices"][0]["message"]["content"] or ""
+            else:
+                error = body.get("error") or item.get("error") or {}
+                errors[item["custom_id"]] = error.get("message")
+    if batch.status != "completed":
+        print(f"Batch {batch_id} ended as {batch.status}")
+    await asyncio.to_thread(finish_batch, batch_id, replies, errors, batch.status)
+
+
+async def poll_batches():
+    """Check pending batches every BATCH_POLL_SECONDS"""
+    while True:
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+        for batch_id in await asyncio.to_thread(pending_batches):
+            try:
+                await check_batch(batch_id)
+            except Exception as e:
+                print(f"Batch poll error ({batch_id}): {e}")
+
+
+# -------------------------------------------------------
+# SEMANTIC CACHE
+# -------------------------------------------------------
+# Optional: reuse roasts across resumes with the same text (exact key) or
+# nearly the same text (embedding similarity above the threshold), e.g.
+# a PDF re-exported from the same source. Off by default; set
+# SEMANTIC_CACHE=1 to enable.
+SEMANTIC_CACHE = bool(os.getenv("SEMANTIC_CACHE"))
+SEMANTIC_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.93"))
+EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
+
+# Rows widened to float32 per step. Small enough that the widened block
+# stays in L2 cache, so a lookup reads the int8 codes from RAM once and the
+# matrix-vector product runs on cached floats.
+SEMANTIC_SCAN_ROWS = 128
+
+# Rows a mode's index starts with; it doubles whenever it fills up
+SEMANTIC_MIN_ROWS = 64
+
+# mode -> {"codes": int8 rows, "scales": per-row float32, "roasts": list}.
+# Embeddings are kept as int8 with a per-row scale (SQ8): a quarter of the
+# memory of float32 at a cosine error far below the threshold's resolution.
+# Lookups take about as long as a float32 scan: they read a quarter of the
+# bytes but spend the difference widening them. SQLite keeps the float32
+# originals. The first len(roasts) rows are in use; rows past that are
+# spare capacity.
+#
+# Lookups and appends run on worker threads. Filled rows are never
+# rewritten and growing swaps in new arrays, so a lookup only needs the
+# lock to take a consistent snapshot.
+_semantic_index = {}
+_semantic_lock = threading.Lock()
+
+def _quantize(vectors):
+    """Per-row int8 codes and scales with codes * scale ~= vectors"""
+    scales = np.abs(vectors).max(axis=1) / 127
+    # An all-zero row would divide by zero; any scale gives it zero codes
+    scales[scales == 0] = 1
+    codes = np.round(vectors / scales[:, np.newaxis]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _index_add(mode, vectors, roasts):
+    """Append unit-length embeddings and their roasts to a mode's index"""
+    new_codes, new_scales = _quantize(vectors)
+    with _semantic_lock:
+        index = _semantic_index.get(mode)
+        size = len(index["roasts"]) if index else 0
+        end = size + len(roasts)
+        if index is None or end > len(index["codes"]):
+            # Double rather than grow by the batch, so filling the index
+            # copies it O(log N) times instead of once per roast
+            capacity = max(end, 2 * size, SEMANTIC_MIN_ROWS)
+            codes = np.empty((capacity, new_codes.shape[1]), dtype=np.int8)
+            scales = np.empty(capacity, dtype=np.float32)
+            if index is not None:
+                codes[:size] = index["codes"][:size]
+                scales[:size] = index["scales"][:size]
+            index = _semantic_index[mode] = {
+                "codes": codes,
+                "scales": scales,
+                "roasts": index["roasts"] if index else []
+            }
+        index["codes"][size:end] = new_codes
+        index["scales"][size:end] = new_scales
+        index["roasts"].extend(roasts)
+
+
+def _read_semantic_cache():
+    """Load every cached embedding and roast from SQLite"""
+    return get_read_conn().execute(SQL_CACHE_ALL).fetchall()
+
+
+async def load_semantic_cache():
+    """Build this worker's in-memory similarity index from SQLite"""
+    by_mode = {}
+    for mode, blob, response in await asyncio.to_thread(_read_semantic_cache):
+        vectors, roasts = by_mode.setdefault(mode, ([], []))
+        vectors.append(np.frombuffer(blob, dtype=np.float32))
+        roasts.append(orjson.loads(response))
+    for mode, (vectors, roasts) in by_mode.items():
+        _index_add(mode, np.vstack(vectors), roasts)
+
+
+def cache_lookup(key):
+    """Exact-key lookup of a cached roast"""
+    row = get_read_conn().execute(SQL_CACHE_GET, (key,)).fetchone()
+    return orjson.loads(row[0]) if row else None
+
+
+def cache_store(key, mode, vector, roast):
+    """Persist a roast and its embedding"""
+    with write_txn() as conn:
+        conn.execute(SQL_CACHE_PUT, (key, mode, vector.tobytes(), orjson.dumps(roast)))
+
+
+async def embed(text):
+    """Unit-length float32 embedding of text, or None if the call fails"""
+    try:
+        async with _openai_slots:
+            res = await client.embeddings.create(model=EMBED_MODEL, input=text)
+    except Exception as e:
+        print(f"Embedding error: {e}")
+        return None
+    vector = np.asarray(res.data[0].embedding, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def nearest_roast(mode, vector):
+    """Most similar cached roast for this mode, if it clears the threshold"""
+    with _semantic_lock:
+        index = _semantic_index.get(mode)
+        if index is None:
+            return None
+        roasts = index["roasts"]
+        size = len(roasts)
+        codes, scales = index["codes"][:size], index["scales"][:size]
+    # Rows and query are unit length, so the dot product is the cosine.
+    # Widen the codes a block at a time into one reused buffer so the
+    # product still runs on BLAS (numpy has no int8 matrix-vector kernel).
+    scores = np.empty(len(codes), dtype=np.float32)
+    buffer = np.empty((SEMANTIC_SCAN_ROWS, codes.shape[1]), dtype=np.float32)
+    for start in range(0, len(codes), SEMANTIC_SCAN_ROWS):
+        block = codes[start:start + SEMANTIC_SCAN_ROWS]
+        widened = buffer[:len(block)]
+        np.copyto(widened, block, casting="unsafe")
+        np.dot(widened, vector, out=scores[start:start + len(block)])
+    scores *= scales
+    best = int(scores.argmax())
+    return roasts[best] if scores[best] >= SEMANTIC_THRESHOLD else None
+
+
+async def roast_cached(text, mode):
+    """Roast through the exact and semantic caches, filling them on a miss"""
+    key = hashlib.sha256(f"{mode}\n{text}".encode("utf-8")).hexdigest()
+    roast = await asyncio.to_thread(cache_lookup, key)
+    if roast is not None:
+        return roast
+
+    vector = await embed(text)
+    if vector is not None:
+        # A full scan is milliseconds of numpy; keep it off the event loop
+        roast = await asyncio.to_thread(nearest_roast, mode, vector)
+        if roast is not None:
+            # A near match is a different file; don't hand over its name
+            return {k: v for k, v in roast.items() if k != "name"}
+
+    roast = await roast_uncached(text, mode)
+    # Only replies the model actually produced carry a name; the error
+    # fallbacks don't, and must not be cached
+    if vector is not None and "name" in roast:
+        await asyncio.to_thread(cache_store, key, mode, vector, roast)
+        await asyncio.to_thread(_index_add, mode, vector[np.newaxis], [roast])
+    return roast
+
+
 # -------------------------------------------------------
 # ROUTES
 # -------------------------------------------------------
+_MB = 1024 * 1024
+
+# path -> (max request bytes, what to tell the user past it)
+REQUEST_LIMITS = {
+    "/upload": (
+        MAX_REQUEST_BYTES,
+        f"File too large. Keep your CV under {MAX_UPLOAD_BYTES // _MB} MB."
+    ),
+    "/upload_batch": (
+        MAX_BATCH_REQUEST_BYTES,
+        f"Batch too large. Keep the whole upload under {MAX_BATCH_REQUEST_BYTES // _MB} MB."
+    ),
+}
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Refuse oversized uploads from the headers, before the body is parsed"""
+    limit, message = REQUEST_LIMITS.get(request.url.path, (None, None))
+    if request.method == "POST" and limit:
+        length = request.headers.get("content-length", "")
+        if length.isdigit() and int(length) > limit:
+            return HTMLResponse(f"<h2>{message}</h2>", status_code=413)
+    return await call_next(request)
+
+
 @app.get("/", response_class=HTMLResponse)
 def home(request: Request):
     """Home page with upload form"""
     return templates.TemplateResponse("index.html", {"request": request})
 
 
+def pick_name(name, roast):
+    """Fall back to the name the model read when the heuristic failed"""
+    if name == "Anonymous":
+        name = (roast.get("name") or "").strip()[:60] or "Anonymous"
+    return name
+
+
+def render_result(request, name, roast):
+    """Render the result page for a roast"""
+    return templates.TemplateResponse("result.html", {
+        "request": request,
+        "name": name,
+        "score": roast["score"],
+        "one_line": roast["one_line"],
+        "overview": roast["overview"],
+        "fun_obs": roast["fun_obs"]
+    })
+
+
 @app.post("/upload", response_class=HTMLResponse)
 async def upload(request: Request, file: UploadFile, mode: str = Form(...)):
     """Handle resume upload and generate roast"""
-    text = extract_text(file)
+    if mode not in ROAST_MODES:
+        return HTMLResponse("<h2>Unknown roast mode.</h2>", status_code=422)
+
+    # Reject oversized files before reading the body into memory
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        await file.close()
+        return HTMLResponse(f"<h2>{REQUEST_LIMITS['/upload'][1]}</h2>", status_code=413)
+
+    # Hash and parse in one pass over the upload. SHA-256 goes through
+    # OpenSSL, which uses the CPU's SHA extensions. Both are blocking, so
+    # they run off the event loop.
+    text, file_hash = await load_upload(file.filename, file.file)
+    text = normalize_text(text)
+    # Truncate once, up front; everything downstream works on this slice
+    text = truncate_tokens(text, MAX_RESUME_TOKENS)
+    # Nothing to roast: answer now rather than store a score-1 placeholder
+    if not text:
+        return HTMLResponse(
+            "<h2>Couldn't read any text from that file. Try a text-based PDF, DOCX or TXT.</h2>",
+            status_code=422
+        )
     name = guess_name(text)
     
-    # Check for duplicate submission
-    if check_duplicate(name, text[:500]):
+    # A file that was roasted before gets its stored roast back, no LLM call.
+    # Recent files are found in memory; otherwise SQLite is checked on a
+    # worker thread (each keeps its own connection open). The roast only
+    # starts once both come up empty, so duplicates never cost an API call.
+    previous, taken = cache_get(file_hash), None
+    if previous is None:
+        previous, taken = await asyncio.to_thread(find_previous, name, file_hash)
+
+    if previous is not None:
+        return render_result(request, previous["name"], previous)
+
+    # Already queued through /upload_batch; its roast is on the way
+    if taken == "pending":
+        return HTMLResponse(
+            "<h2>That resume is already queued in a batch. "
+            "Its roast will show up on the leaderboard within 24 hours.</h2>",
+            status_code=409
+        )
+
+    # Same name, different file: someone fishing for a better score
+    if taken == "name":
         return templates.TemplateResponse("duplicate.html", {
             "request": request,
             "name": name
         })
-    
-    roast = roast_resume(text, mode)
-
-    # Save to database
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO roasts (name, score, one_line, overview, fun_obs, created_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (
-        name,
-        roast["score"],
-        roast["one_line"],
-        roast["overview"],
-        roast["fun_obs"],
-        datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    ))
-    conn.commit()
-    conn.close()
 
-    return templates.TemplateResponse("result.html", {
-        "request": request,
-        "name": name,
-        "score": roast["score"],
-        "one_line": roast["one_line"],
-        "overview": roast["overview"],
-        "fun_obs": roast["fun_obs"]
-    })
+    roast = await roast_resume(text, mode)
+
+    name = pick_name(name, roast)
+    await store_roast(name, roast, file_hash)
+
+    return render_result(request, name, roast)
+
+
+LEADERBOARD_PAGE_SIZE = 40
+# Keeps the OFFSET within SQLite's integer range (and well past any real page)
+LEADERBOARD_MAX_PAGE = 10_000
+
+# Scores don't move fast enough to justify a query + render per hit, so
+# rendered pages are reused for a few seconds, or until this process
+# stores a new roast. Other workers' roasts show up once the TTL runs out.
+# Only the first few pages are cached to keep the cache bounded.
+LEADERBOARD_TTL = 10
+LEADERBOARD_CACHED_PAGES = 5
+_leaderboard_cache = {}  # page -> (rendered_at, html)
+
+@app.post("/upload_batch", response_class=HTMLResponse)
+async def upload_batch(files: list[UploadFile], mode: str = Form("full")):
+    """Queue many resumes for a Batch API roast; results land on the leaderboard"""
+    if mode not in ROAST_MODES:
+        return HTMLResponse("<h2>Unknown roast mode.</h2>", status_code=422)
+    if len(files) > BATCH_MAX_FILES:
+        return HTMLResponse(
+            f"<h2>Too many files. Send at most {BATCH_MAX_FILES} per batch.</h2>",
+            status_code=413
+        )
+
+    requests, too_large = {}, 0
+    for file in files:
+        if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+            too_large += 1
+            continue
+        text, file_hash = await load_upload(file.filename, file.file)
+        text = truncate_tokens(normalize_text(text), MAX_RESUME_TOKENS)
+        if not text or file_hash in requests:
+            continue
+        name = guess_name(text)
+        # Same rules as /upload: no second roast for a file or a name, and
+        # nothing already waiting in another batch
+        previous, taken = await asyncio.to_thread(find_previous, name, file_hash)
+        if previous is None and not taken:
+            requests[file_hash] = (name, text)
+
+    skipped = (
+        f" Skipped {too_large} file(s) over {MAX_UPLOAD_BYTES // _MB} MB." if too_large else ""
+    )
+    if not requests:
+        return HTMLResponse(f"<h2>Nothing new to roast in that batch.{skipped}</h2>")
+
+    try:
+        batch_id = await submit_batch(requests, mode)
+    except Exception as e:
+        print(f"Batch submit error: {e}")
+        return HTMLResponse("<h2>Couldn't queue the batch. Try again later.</h2>", status_code=502)
+
+    return HTMLResponse(
+        f"<h2>Queued {len(requests)} resumes (batch {batch_id}). "
+        f"Their roasts will show up on the leaderboard within 24 hours.{skipped}</h2>"
+    )
 
 
 @app.get("/leaderboard", response_class=HTMLResponse)
-def leaderboard(request: Request):
-    """Show top 40 roasts"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT name, score, one_line, created_at
-        FROM roasts
-        ORDER BY score DESC, created_at DESC
-        LIMIT 40
-    """)
-    rows = cursor.fetchall()
-    conn.close()
-
-    return templates.TemplateResponse(
-        "leaderboard.html",
-        {"request": request, "roasts": rows}
+def leaderboard(request: Request, page: int = Query(1, ge=1, le=LEADERBOARD_MAX_PAGE)):
+    """Show roasts ranked by score, 40 per page"""
+    now = time.monotonic()
+    cached = _leaderboard_cache.get(page)
+    if cached and _roasts_changed_at < cached[0] and now < cached[0] + LEADERBOARD_TTL:
+        return HTMLResponse(cached[1])
+
+    rows = get_read_conn().execute(
+        SQL_LEADERBOARD,
+        (LEADERBOARD_PAGE_SIZE, (page - 1) * LEADERBOARD_PAGE_SIZE)
+    ).fetchall()
+    html = templates.get_template("leaderboard.html").render(
+        request=request,
+        roasts=rows,
+        page=page,
+        has_next=len(rows) == LEADERBOARD_PAGE_SIZE
     )
+    if page <= LEADERBOARD_CACHED_PAGES:
+        # Stamped with the time before the query, so a roast committed
+        # while this page was rendering still invalidates it
+        _leaderboard_cache[page] = (now, html)
+
+    return HTMLResponse(html)
 
 
 @app.get("/test-api")
-def test_api():
+async def test_api():
     """Test endpoint to verify OpenAI API connection"""
     try:
-        res = client.chat.completions.create(
-            model="gpt-4o-mini",
+        res = await chat_completion(
+            model=ROAST_MODEL,
             messages=[{"role": "user", "content": "Say 'API works!'"}],
             max_tokens=10
         )
@@ -330,4 +1406,6 @@ def test_api():
 # -------------------------------------------------------
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=7860)
\ No newline at end of file
+    # One worker per core, like the Docker image; WAL lets them share the DB
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+    uvicorn.run("main:app", host="0.0.0.0", port=7860, workers=workers)
\ No newline at end of file